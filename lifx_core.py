@@ -0,0 +1,419 @@
+"""Shared core for the lifx scripts: sockets, state decoding and motion handling"""
+from __future__ import annotations
+
+import atexit
+import logging
+import queue
+import sched
+import selectors
+import socket
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from enum import Enum
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict
+
+from gpiozero import MotionSensor
+
+from packet_builder import MSGHEADER, Packet, deconstruct
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+CONSOLE_FORMAT = logging.Formatter('[%(levelname)s]: %(message)s', "%H:%M:%S")
+logconsole = logging.StreamHandler()
+logconsole.setFormatter(CONSOLE_FORMAT)
+logconsole.setLevel(logging.DEBUG)
+
+FILE_FORMAT = logging.Formatter('[%(asctime)s] [%(levelname)s]: %(message)s', "%H:%M:%S")
+logfile = logging.FileHandler(f"log/lifx {datetime.now().strftime('%Y-%m-%d')}.log", "a")
+logfile.setFormatter(FILE_FORMAT)
+logfile.setLevel(logging.INFO)
+
+# Handlers run on a listener thread so PIR callbacks only enqueue records
+# instead of blocking on console/disk writes
+_log_queue = queue.Queue(-1)
+log.addHandler(QueueHandler(_log_queue))
+_log_listener = QueueListener(_log_queue, logconsole, logfile, respect_handler_level=True)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+
+def uncaught_handler(exception_type, value, traceback):
+    """Log uncaught exceptions. To file and console."""
+    log.exception(
+        "Uncaught exception: %s: %s",
+        value.__class__.__name__,
+        value,
+        exc_info=(
+            exception_type,
+            value,
+            traceback))
+
+
+# Log uncaught exceptions to file & stdout
+sys.excepthook = uncaught_handler
+
+
+class Device(Enum):
+    """Devices enumerator"""
+    # Name = (IP, PORT)
+    Taklampa = ("192.168.1.99", 56700)
+    LIFXZ = ("192.168.1.45", 56700)
+
+
+# One connected socket per device, reused across polls
+_socket_cache: Dict[Device, socket.socket] = {}
+_selector = selectors.DefaultSelector()
+
+# Seconds to wait for a response before giving up
+RESPONSE_TIMEOUT = 5
+
+
+def _get_sock(device: Device) -> socket.socket:
+    """Return the cached connected socket for a device, creating it on first use"""
+    sock = _socket_cache.get(device)
+    if sock is None:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        sock.connect(device.value)
+        _socket_cache[device] = sock
+        _selector.register(sock, selectors.EVENT_READ)
+    return sock
+
+
+def _evict_sock(device: Device):
+    """Drop a failed socket from the cache so the next call reconnects"""
+    sock = _socket_cache.pop(device, None)
+    if sock is not None:
+        _selector.unregister(sock)
+        sock.close()
+
+
+def _drain_sock(sock: socket.socket):
+    """Discard stale replies left over from earlier timed-out requests
+
+    The socket is cached across calls, so a reply that arrives after its
+    request timed out stays queued and would be returned for the next
+    request, leaving every later poll one response behind.
+    """
+    while True:
+        try:
+            sock.recv(0xff)
+        except BlockingIOError:
+            return
+
+
+def _wait_readable(sock: socket.socket, timeout: float = RESPONSE_TIMEOUT):
+    """Multiplexed wait until `sock` has a response, instead of a blocking recv"""
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise socket.timeout("Timed out waiting for response")
+        for key, _ in _selector.select(remaining):
+            if key.fileobj is sock:
+                return
+
+
+def _close_sockets():
+    """Close all cached sockets on exit"""
+    for sock in _socket_cache.values():
+        sock.close()
+    _selector.close()
+
+
+atexit.register(_close_sockets)
+
+
+def _as_bytes(bytestring: Packet | bytes) -> bytes:
+    """Accept a Packet or an already-serialized packet"""
+    if isinstance(bytestring, (bytes, bytearray)):
+        return bytestring
+    return bytestring.bytearray()
+
+
+def _msgtype(data: bytes) -> int:
+    """Message type field of a serialized packet"""
+    return int.from_bytes(data[32:34], "little")
+
+
+def send_packet(device: Device, bytestring: Packet | bytes, silent: bool = False):
+    """Send a packet to a device"""
+    data = _as_bytes(bytestring)
+    if not silent:
+        log.debug("Sending packet %d to %s...", _msgtype(data), device.name)
+    try:
+        return _get_sock(device).send(data)
+    except OSError:
+        # Failed sockets are not reused; reconnect and retry once
+        _evict_sock(device)
+        return _get_sock(device).send(data)
+
+
+def send_packets(device: Device, packets, silent: bool = False):
+    """Send a batch of packets over the device's cached socket
+
+    The socket module does not expose sendmmsg, so the batching is at the
+    Python level: one cached socket and one send per buffer, with no
+    per-packet socket setup or teardown.
+    """
+    if not silent:
+        log.debug("Sending %d packets to %s...", len(packets), device.name)
+    try:
+        sock = _get_sock(device)
+        for data in packets:
+            sock.send(_as_bytes(data))
+    except OSError:
+        # Failed sockets are not reused; reconnect and resend the batch
+        _evict_sock(device)
+        sock = _get_sock(device)
+        for data in packets:
+            sock.send(_as_bytes(data))
+
+
+def send_recieve_packet(device: Device, bytestring: Packet | bytes, silent: bool = False):
+    """Send a packet and return recieved response"""
+    data = _as_bytes(bytestring)
+    if not silent:
+        log.debug("Sending packet %d to %s...", _msgtype(data), device.name)
+    try:
+        sock = _get_sock(device)
+        _drain_sock(sock)
+        sock.send(data)
+        if not silent:
+            log.debug("Recieveing response from device %s...", device.name)
+        _wait_readable(sock)
+        return sock.recv(0xff)
+    except socket.timeout:
+        raise
+    except OSError:
+        _evict_sock(device)
+        sock = _get_sock(device)
+        sock.send(data)
+        if not silent:
+            log.debug("Recieveing response from device %s...", device.name)
+        _wait_readable(sock)
+        return sock.recv(0xff)
+
+
+# The get_state packet is constant, so serialize it once at import
+_GET_STATE_BYTES = bytes(Packet.get_state_bytes())
+
+# Decodemap for state responses, built once instead of per poll
+_STATE_DECODEMAP = tuple(MSGHEADER) + (
+    ("hue", 16),
+    ("saturation", 16),
+    ("brightness", 16),
+    ("kelvin", 16),
+    ("reserved", 16),
+    ("power", 16),
+    ("label", 32),
+    ("reserved", 64),
+)
+
+
+@dataclass(slots=True, frozen=True)
+class LightState:
+    """Decoded light state of a device"""
+    hue: int
+    saturation: int
+    brightness: int
+    kelvin: int
+    power: int
+    label: int = 0
+
+
+def get_state(device: Device, silent: bool = False) -> LightState:
+    """Get the light state of a device"""
+    response = send_recieve_packet(device, _GET_STATE_BYTES, silent=silent)
+    if not silent:
+        log.debug("Receiving state...")
+    fields = dict(deconstruct(response, _STATE_DECODEMAP))
+    return LightState(
+        hue=fields["hue"],
+        saturation=fields["saturation"],
+        brightness=fields["brightness"],
+        kelvin=fields["kelvin"],
+        power=fields["power"],
+        label=fields["label"],
+    )
+
+
+class MotionHandler:
+    """Handles triggers from a PIR"""
+    dark = 0.01
+    # Seconds last_state stays fresh enough to skip a get_state round-trip
+    state_max_age = 30
+
+    def __init__(self, pir: MotionSensor, delay: timedelta,
+                 fadetime: timedelta, enable_fading: bool = True):
+        self.pir = pir
+        self.delay = delay
+        self.fadetime = fadetime
+        self.enable_fading = enable_fading
+        self.last_state: LightState | None = None
+        self._last_state_ts = 0.0
+        self.is_active = True
+        self.is_fading = False
+
+        # One long-lived worker thread runs all delayed callbacks,
+        # instead of spawning a new Timer thread per PIR event
+        self._sched_wakeup = threading.Event()
+        self._sched = sched.scheduler(time.monotonic, self._sched_wait)
+        self._timeout_handle = None
+        self._fading_handle = None
+        self._worker = threading.Thread(target=self._run_scheduler, daemon=True)
+        self._worker.start()
+
+        self.pir.when_activated = self.motion
+        self.pir.when_deactivated = self.no_motion
+        self._last_motion_monotonic = time.monotonic()
+
+    @property
+    def waittime(self):
+        """Returns seconds to wait for delay"""
+        return self.delay.total_seconds()
+
+    def _sched_wait(self, timeout):
+        """Interruptible delay so newly scheduled callbacks are picked up"""
+        self._sched_wakeup.wait(timeout)
+        self._sched_wakeup.clear()
+
+    def _run_scheduler(self):
+        """Run scheduled callbacks forever on the worker thread"""
+        while True:
+            try:
+                self._sched.run(blocking=True)
+            except Exception:
+                # A failing callback must not kill the only timer thread
+                log.exception("Uncaught exception in scheduled callback")
+                continue
+            self._sched_wakeup.wait()
+            self._sched_wakeup.clear()
+
+    def _cancel(self, handle):
+        """Cancel a scheduled callback, ignoring already-fired ones"""
+        if handle is not None:
+            try:
+                self._sched.cancel(handle)
+            except ValueError:
+                pass
+
+    def _reset_timer(self, attr, seconds, fn):
+        """Cancel and reschedule the callback handle stored on `attr`"""
+        self._cancel(getattr(self, attr))
+        setattr(self, attr, self._sched.enter(seconds, 1, fn))
+        self._sched_wakeup.set()
+
+    def fading_false(self):
+        """Set `self.is_fading` to False"""
+        self.is_fading = False
+
+    def timeout(self):
+        """Funciton triggered `delay` time after no motion"""
+        try:
+            self.is_active = False
+            self.brightness(self.dark, self.fadetime.total_seconds())
+            if self.enable_fading:
+                self._reset_timer(
+                    "_fading_handle", self.fadetime.total_seconds(), self.fading_false)
+                self.is_fading = True
+            log.info("Timer executed!")
+        except Exception:
+            # Runs on the shared scheduler thread; log instead of killing it
+            log.exception("Uncaught exception in timer callback")
+
+    def motion(self):
+        """Triggered when PIR senses motion"""
+        self._last_motion_monotonic = time.monotonic()
+        self._cancel(self._fading_handle)
+        self._fading_handle = None
+        self._cancel(self._timeout_handle)
+        self._timeout_handle = None
+        if not self.is_active:
+            state = self.last_state
+            self.brightness(state.brightness / 0xFFFF if state is not None else 1)
+        log.info("Timer cancelled")
+        self.is_active = True
+
+    def no_motion(self):
+        """Triggered when PIR senses no motion"""
+        # self.brightness(0.5)
+        log.info("Timer reset and started")
+        self._reset_timer("_timeout_handle", self.waittime, self.timeout)
+
+    def brightness(self, level: float, duration: float = 0.1):
+        """Set the light to given brightnes over duration in seconds"""
+        if self.last_state is not None \
+                and time.monotonic() - self._last_state_ts < self.state_max_age:
+            # Fresh enough, skip the network round-trip on the timer thread
+            state = self.last_state
+        else:
+            state = get_state(Device.Taklampa)
+        log.debug("Changing brightness to %.2f over %.2f seconds...", level, duration)
+        send_packet(
+            Device.Taklampa,
+            Packet.state_bytes(
+                state.hue,
+                state.saturation,
+                level * 0xFFFF,
+                state.kelvin,
+                duration
+            ))
+
+
+# Adaptive polling: tight right after motion, backing off while idle
+POLL_MIN = 1
+POLL_MAX = 60
+IDLE_MIN = 30
+
+
+def main(argv=None, enable_fading: bool = True):
+    """Run the motion-controlled light loop"""
+    args = dict(enumerate(sys.argv if argv is None else argv))
+    # BCM Pin 17, Physical 11
+    handler = MotionHandler(
+        MotionSensor(17),
+        timedelta(minutes=float(args.get(1, 5))),
+        fadetime=timedelta(minutes=float(args.get(2, 5))),
+        enable_fading=enable_fading
+    )
+
+    interval = 5
+    last_motion_seen = handler._last_motion_monotonic
+    while True:
+        try:
+            if handler.is_active or (not handler.is_active and not handler.is_fading):
+                new_state = get_state(Device.Taklampa, silent=True)
+                changed = False
+                if new_state.brightness > (handler.dark * 10) * 0xFFFF \
+                        and new_state.power >= 0xFF00:
+                    if handler.last_state is None \
+                            or new_state.brightness != handler.last_state.brightness:
+                        if log.isEnabledFor(logging.DEBUG):
+                            log.debug(
+                                "Setting last state to %s, %s",
+                                new_state.brightness,
+                                new_state.power)
+                        handler.last_state = new_state
+                        changed = True
+                    handler._last_state_ts = time.monotonic()
+                interval = POLL_MIN if changed else min(interval * 2, POLL_MAX)
+        except socket.timeout:
+            log.error(
+                "Socket timed out during ping to %s, retrying in %d seconds",
+                Device.Taklampa.value,
+                interval,
+                exc_info=False)
+        finally:
+            if handler._last_motion_monotonic != last_motion_seen:
+                # State is about to change, poll tightly again
+                last_motion_seen = handler._last_motion_monotonic
+                interval = POLL_MIN
+            if not handler.is_active and not handler.is_fading:
+                interval = max(IDLE_MIN, interval)
+            time.sleep(interval)
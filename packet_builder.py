@@ -14,39 +14,42 @@ Usage:
 from __future__ import annotations
 
 import struct
-from typing import List
-from functools import reduce
+from dataclasses import dataclass
+from typing import Tuple
 
-# import pretty_errors
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the plain loop still works
+    njit = None
+
+
+# Precomputed hex strings for the common single-byte case
+_HEX2 = [f"0x{i:02x}" for i in range(256)]
 
 
 def hex_pad(number, fill=2):
     """Padds a number with zeros and returns hex"""
+    if fill == 2 and isinstance(number, int) and 0 <= number < 256:
+        return _HEX2[number]
     try:
-        number = int(number)
-    except ValueError:
-        return "0x00"
-    return f"0x{hex(number)[2:].zfill(fill)}"
-
-
-def tobytes(number: int):
-    """Divide a number by 8"""
-    return int(number / 8)
+        return f"0x{int(number):0{fill}x}"
+    except (ValueError, TypeError):
+        return "0x" + "0" * fill
 
 
-def to_bytearray(num: int, bitlength=8):
-    """Turns an integer into byte array"""
-    return list(num.to_bytes((num.bit_length() + bitlength - 1) // bitlength, "little"))
+def encode_value(values: int | list, length: int, reverse: bool = False) -> bytes:
+    """Fixed-width little-endian (big if `reverse`) bytes for a parameter value"""
+    if isinstance(values, (bytes, bytearray, list)):
+        return bytes(values)[:length].ljust(length, b"\x00")
+    return int(values).to_bytes(length, "big" if reverse else "little")
 
 
 def packbytes(*pieces: tuple):
     """Pack bits into bytes"""
-    def append(prev, new):
-        val, length = new
-        prev <<= length
-        prev |= val
-        return prev
-    return reduce(append, pieces, pieces[0][0])
+    acc = 0
+    for val, length in pieces:
+        acc = (acc << length) | val
+    return acc
 
 
 def deconstruct(packet: bytes, sizes: dict):
@@ -57,19 +60,61 @@ def deconstruct(packet: bytes, sizes: dict):
         if isinstance(size, dict):
             subsizes = size
             size = sum(size.values())
-        piece = packet[index:index + size // 8]
-        piece = int.from_bytes(piece, "little")
+        piece = int.from_bytes(packet[index:index + size // 8], "little")
         index += size // 8
         if subsizes:
-            subindex = 0
+            # Subfields are declared most-significant first
+            shift = size
             for k, subsize in subsizes.items():
-                part = f"{piece:0{size}b}"[subindex:subindex + subsize]
-                subindex += subsize
-                yield k, int(part, 2)
+                shift -= subsize
+                yield k, (piece >> shift) & ((1 << subsize) - 1)
         else:
             yield key, piece
 
 
+def _pack_hsbk_array(buf, off, hues, sats, brights, kelvins):
+    """Write parallel HSBK arrays into `buf` as repeated 8-byte zones"""
+    for i in range(len(hues)):
+        b = off + i * 8
+        buf[b] = hues[i] & 0xFF
+        buf[b + 1] = (hues[i] >> 8) & 0xFF
+        buf[b + 2] = sats[i] & 0xFF
+        buf[b + 3] = (sats[i] >> 8) & 0xFF
+        buf[b + 4] = brights[i] & 0xFF
+        buf[b + 5] = (brights[i] >> 8) & 0xFF
+        buf[b + 6] = kelvins[i] & 0xFF
+        buf[b + 7] = (kelvins[i] >> 8) & 0xFF
+
+
+if njit is not None:
+    pack_hsbk_array = njit(cache=True, boundscheck=False)(_pack_hsbk_array)
+else:
+    pack_hsbk_array = _pack_hsbk_array
+
+
+# Frame protocol field with origin=0, addressable=1, protocol=1024;
+# the tagged flag (bit 13) is OR'd in per packet
+_PROTO_BASE = (1 << 12) | 1024
+
+# Compiled structs for the serialized packet fast path
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+_STATE_PAYLOAD = struct.Struct("<BHHHHI")  # reserved, HSBK, duration
+_POWER_PAYLOAD = struct.Struct("<HI")  # level, duration
+_ZONES_PAYLOAD = struct.Struct("<IBHB")  # duration, apply, zone_index, colors_count
+MAX_ZONES = 82  # HSBK quads per SetExtendedColorZones packet
+
+# Byte offsets of the fixed header fields
+# https://lan.developer.lifx.com/docs/packet-contents
+OFF_SIZE = 0
+OFF_PROTO = 2
+OFF_SOURCE = 4
+OFF_TARGET = 8
+OFF_RESP = 22
+OFF_SEQ = 23
+OFF_TYPE = 32
+HEADER_LEN = 36
+
 MSGHEADER = [
     ("size", 16),
     ("protocol", {
@@ -93,51 +138,46 @@ MSGHEADER = [
 ]
 
 
-class Packet:
-    """A class to store an ip packet"""
+class LegacyPacket:
+    """A class to store an ip packet as a tree of parts
+
+    Kept for pprint()-style per-field debugging; the flat-buffer `Packet`
+    below is what the senders use.
+    """
     class Part:
         """A class to store parts of an ip packet"""
-        class Parameter(bytearray):
+        @dataclass(slots=True)
+        class Parameter:
             """A class to store parameters of a part"""
+            data: bytes = b""
+            name: str = ""
+
+            def __len__(self) -> int:
+                return len(self.data)
 
-            def __init__(self,
-                         name: str = "",
-                         values: int | list = 0,
-                         length: int = 0,
-                         reverse: bool = False):
-                super().__init__(length)
-                self.name = name
-                if values:
-                    if not isinstance(values, list):
-                        # values = bytearray.fromhex(hex(values)[2:].zfill(2))
-                        # values = [int(val, 16) for val in values]
-                        val = to_bytearray(int(values))
-                        values = val + [0] * (length - len(val))
-                        # values = [val.pop() if val else 0 for _ in range(length)]
-                        if reverse:
-                            values.reverse()
-                    for i, value in enumerate(values):
-                        self[i] = value
-                    self.zfill(length)
-
-            def append(self, v: int, fmt='<B'):
-                self.extend(struct.pack(fmt, v))
+            def __iter__(self):
+                return iter(self.data)
+
+            def __bytes__(self) -> bytes:
+                return self.data
 
             def __str__(self) -> str:
-                return ' '.join([str(i) for i in self])
+                return ' '.join([str(i) for i in self.data])
 
             def __repr__(self) -> str:
                 nameslug = self.name.replace(' ', '_')
-                contents = ', '.join(str(num) for num in list(self))
-                value = int.from_bytes(self, 'little')
-                percentage = round(value * 100 / (256**len(self) - 1))
+                contents = ', '.join(str(num) for num in self.data)
+                value = int.from_bytes(self.data, 'little')
+                percentage = round(value * 100 / (256**len(self.data) - 1))
                 return f"{type(self).__name__}:{nameslug}({contents}) == {value}, {percentage}%"
 
         def __init__(self, size: int = 0):
             self.parameters = []
+            self._nbytes = 0
             self.set_length(size)
 
         def __setitem__(self, index, value):
+            self._nbytes += len(value) - len(self.parameters[index])
             self.parameters[index] = value
 
         def set_length(self, size: int):
@@ -148,21 +188,24 @@ class Packet:
         def __getitem__(self, item) -> Parameter:
             return self.parameters[item]
 
-        def __getattr__(self, method):
-            return getattr(self.parameters, method)
+        def __iter__(self):
+            return iter(self.parameters)
 
         def __len__(self) -> int:
-            return sum([len(p) for p in self.parameters])
+            return self._nbytes
 
         def prepend_param(self, name: str, value: any, length: int):
-            """Add a parameter to the beginning of the part
-            Arguments are passed to Parameter constructor."""
-            return self.parameters.insert(0, self.Parameter(name, value, length))
-
-        def append_param(self, *args, **kwargs):
-            """Add a parameter to the end of the part.
-            Arguments are passed to Parameter constructor."""
-            return self.parameters.append(self.Parameter(*args, **kwargs))
+            """Add a parameter to the beginning of the part"""
+            parameter = self.Parameter(encode_value(value, length), name)
+            self._nbytes += len(parameter)
+            return self.parameters.insert(0, parameter)
+
+        def append_param(self, name: str = "", values: int | list = 0,
+                         length: int = 0, reverse: bool = False):
+            """Add a parameter to the end of the part"""
+            parameter = self.Parameter(encode_value(values, length, reverse), name)
+            self._nbytes += len(parameter)
+            return self.parameters.append(parameter)
 
         def __repr__(self) -> str:
             return f"{type(self).__name__}({' '.join([repr(param) for param in self.parameters])})"
@@ -172,10 +215,12 @@ class Packet:
         self.frame_address = self.Part()  # Size: 16
         self.protocol_header = self.Part()  # Size: 12
         self.payload = self.Part()  # Variable size
+        self._parts = (self.frame, self.frame_address,
+                       self.protocol_header, self.payload)
 
-    def get_parts(self) -> List[Part]:
-        """List of child Parts"""
-        return list(vars(self).values())
+    def get_parts(self) -> Tuple[Part, ...]:
+        """The child Parts, cached at construction"""
+        return self._parts
 
     def set_size(self, length=2):
         """Set the size of the whole ip packet as the first `length` bytes"""
@@ -183,27 +228,22 @@ class Packet:
         # if self.frame[0].name == "size":
         # else:
         self.frame.prepend_param("size", 0, length)
-        self.frame[0] = self.Part.Parameter(
-            "size", len(self), 2, reverse=False)
+        self.frame[0] = self.Part.Parameter(encode_value(len(self), 2), "size")
 
     def __len__(self) -> int:
-        return sum([len(l) for l in self.get_parts()])
+        return (self.frame._nbytes + self.frame_address._nbytes
+                + self.protocol_header._nbytes + self.payload._nbytes)
 
     def __getitem__(self, item):
         return self.get_parts()[item]
 
     def get_bytes(self):
         """Returns a list with the bytes of the whole package"""
-        result = []
-        for part in self.get_parts():
-            for param in part:
-                for byte in param:
-                    result.append(byte)
-        return result
+        return list(self.bytearray())
 
     def hex_string(self, separator: str = ' '):
         """A separated list of the hex bytes"""
-        return separator.join([f"{hex_pad(byte)}" for byte in self.get_bytes()])
+        return separator.join(_HEX2[byte] for byte in self.bytearray())
 
     def bytestring(self):
         """Bytestring notation of the hex bytes"""
@@ -211,19 +251,18 @@ class Packet:
 
     def bytearray(self):
         """Flattened byte-like object"""
-        bytelist = bytearray()
-        for part in self.get_parts():
-            for param in part:
-                bytelist += param
-                # for byte in param:
-                #     bytelist += bytes(byte)
-        return bytelist
+        return b"".join(
+            param.data for part in self.get_parts() for param in part.parameters)
 
     def pprint(self, width=4):
         """Prints the whole ip packet in YAML"""
+        if not __debug__:
+            return
         spacing = " " * width
         print("Packet:")
         for partname, part in vars(self).items():
+            if partname.startswith("_"):
+                continue
             print(f"{spacing}Part: {partname}")
             for parameter in part:
                 print(f"{spacing * 2}{repr(parameter)}")
@@ -233,7 +272,7 @@ class Packet:
         """Message type"""
         msgtype = next(filter(lambda par: par.name ==
                               "message type", self.protocol_header))
-        return int.from_bytes(msgtype, 'little')
+        return int.from_bytes(msgtype.data, 'little')
 
     def info(self):
         """Print a short representation of the packet"""
@@ -252,24 +291,25 @@ class Packet:
         `msgtype`: 117=setpower, 102=setcolor, 101=getstate
         """
         # origin = 0, tagged = 1|0, addressable = 1, protocol = 1024
-        protocol = packbytes((0b00, 2), (tagged, 1), (True, 1), (1024, 12))
-        self.frame.append_param("protocol", protocol, tobytes(16))
-        self.frame.append_param("source", source, tobytes(32))  # client id
-        self.frame_address.append_param("target", 0, tobytes(64))
-        self.frame_address.append_param("reserved", 0, tobytes(48))
+        protocol = _PROTO_BASE | (tagged << 13)
+        self.frame.append_param("protocol", protocol, 2)
+        self.frame.append_param("source", source, 4)  # client id
+        self.frame_address.append_param("target", 0, 8)
+        self.frame_address.append_param("reserved", 0, 6)
         # reserved, ack_required, res_required
         resp = packbytes((0, 6), (ack_required, 1), (res_required, 1))
-        self.frame_address.append_param("resp", resp, tobytes(8))
-        self.frame_address.append_param("sequence", sequence, tobytes(8))
-        self.protocol_header.append_param("reserved", 0, tobytes(64))
-        self.protocol_header.append_param("message type", msgtype, tobytes(16))
-        self.protocol_header.append_param("reserved", 0, tobytes(16))
+        self.frame_address.append_param("resp", resp, 1)
+        self.frame_address.append_param("sequence", sequence, 1)
+        self.protocol_header.append_param("reserved", 0, 8)
+        self.protocol_header.append_param("message type", msgtype, 2)
+        self.protocol_header.append_param("reserved", 0, 2)
 
     def __str__(self) -> str:
         return self.hex_string(', ')
 
     def __repr__(self) -> str:
-        return f"{type(self).__name__}({', '.join([repr(a) for a in self.get_parts()])})"
+        # Cheap on purpose; pprint() gives the full per-parameter view
+        return f"{type(self).__name__}(<{len(self)}B>)"
 
     @classmethod
     def get_state(cls):
@@ -295,13 +335,12 @@ class Packet:
         packet.set_headers(102)
         packet.payload.append_param("reserved", 0, 1)
         # between 0xFFFF and 0x0000
-        packet.payload.append_param("hue", int(hue), tobytes(16))
-        packet.payload.append_param("saturation", int(saturation), tobytes(16))
-        packet.payload.append_param("brightness", int(brightness), tobytes(16))
-        packet.payload.append_param("kelvin", int(kelvin), tobytes(16))
+        packet.payload.append_param("hue", int(hue), 2)
+        packet.payload.append_param("saturation", int(saturation), 2)
+        packet.payload.append_param("brightness", int(brightness), 2)
+        packet.payload.append_param("kelvin", int(kelvin), 2)
         # In milliseconds
-        packet.payload.append_param(
-            "duration", int(duration * 1000), tobytes(32))
+        packet.payload.append_param("duration", int(duration * 1000), 4)
         packet.set_size()
         return packet
 
@@ -311,10 +350,9 @@ class Packet:
         packet = cls()
         # https://lan.developer.lifx.com/docs/changing-a-device#setlightpower---packet-117
         packet.set_headers(117)
-        packet.payload.append_param("level", int(0xFFFF * power), tobytes(16))
+        packet.payload.append_param("level", int(0xFFFF * power), 2)
         # In milliseconds
-        packet.payload.append_param(
-            "duration", int(duration * 1000), tobytes(32))
+        packet.payload.append_param("duration", int(duration * 1000), 4)
         packet.set_size()
         return packet
 
@@ -325,14 +363,231 @@ class Packet:
         # https://lan.developer.lifx.com/docs/changing-a-device#setpower---packet-21
         packet.set_headers(21)
         # 0xFFFF or 0x0000
-        packet.payload.append_param("level", int(0xFFFF * power), tobytes(16))
+        packet.payload.append_param("level", int(0xFFFF * power), 2)
         packet.set_size()
         return packet
 
 
+def _build_header_template() -> bytes:
+    """Serialize an empty packet once; constant header fields stay prefilled"""
+    packet = LegacyPacket()
+    packet.set_headers(0)
+    packet.set_size()
+    return bytes(packet.bytearray())
+
+
+_HEADER_TEMPLATE = _build_header_template()
+
+
+class Packet:
+    """A LIFX LAN packet as a single flat byte buffer
+
+    The header layout is fixed, so fields are patched in place at the
+    OFF_* offsets instead of being assembled from a tree of parts.
+    Build the same packet with `LegacyPacket` for a pprint() view.
+    """
+
+    def __init__(self, payload_size: int = 0) -> None:
+        self.buf = bytearray(HEADER_LEN + payload_size)
+        self.buf[:HEADER_LEN] = _HEADER_TEMPLATE
+        self.set_size()
+
+    def set_size(self):
+        """Set the size of the whole ip packet as the first 2 bytes"""
+        _U16.pack_into(self.buf, OFF_SIZE, len(self.buf))
+
+    def set_headers(self, msgtype, tagged=False, source=123,
+                    res_required=True, ack_required=False, sequence=0):
+        """
+        Set common packet headers
+        https://lan.developer.lifx.com/docs/packet-contents
+        `msgtype`: 117=setpower, 102=setcolor, 101=getstate
+        """
+        _U16.pack_into(self.buf, OFF_PROTO, _PROTO_BASE | (tagged << 13))
+        _U32.pack_into(self.buf, OFF_SOURCE, source)
+        self.buf[OFF_RESP] = (ack_required << 1) | res_required
+        self.buf[OFF_SEQ] = sequence
+        _U16.pack_into(self.buf, OFF_TYPE, msgtype)
+
+    def __len__(self) -> int:
+        return len(self.buf)
+
+    def __bytes__(self) -> bytes:
+        return bytes(self.buf)
+
+    def get_bytes(self):
+        """Returns a list with the bytes of the whole package"""
+        return list(self.buf)
+
+    def hex_string(self, separator: str = ' '):
+        """A separated list of the hex bytes"""
+        return separator.join(_HEX2[byte] for byte in self.buf)
+
+    def bytestring(self):
+        """Bytestring notation of the hex bytes"""
+        return self.hex_string().replace("0x", r"\x").replace(" ", "")
+
+    def bytearray(self):
+        """Flattened byte-like object"""
+        return self.buf
+
+    @property
+    def msgtype(self):
+        """Message type"""
+        return _U16.unpack_from(self.buf, OFF_TYPE)[0]
+
+    def __str__(self) -> str:
+        return self.hex_string(', ')
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(<{len(self.buf)}B>)"
+
+    @classmethod
+    def _build(cls, msgtype: int, payload_size: int = 0, source: int = 123,
+               sequence: int = 0, tagged: bool = False,
+               ack_required: bool = False, res_required: bool = True):
+        """One flat buffer with headers set and payload room after HEADER_LEN
+
+        The caller packs the payload in place at offset `HEADER_LEN`.
+        """
+        packet = cls(payload_size)
+        packet.set_headers(msgtype, tagged, source,
+                           res_required, ack_required, sequence)
+        return packet.buf
+
+    # Wire buffers reused between calls, keyed by packet kind. A pooled
+    # buffer is overwritten by the next call for the same kind, which is
+    # fine for the single-threaded senders: send (or copy) it first.
+    _pool: dict = {}
+
+    @classmethod
+    def _pooled(cls, kind: str, msgtype: int, payload_size: int = 0):
+        """Fetch the reusable buffer for `kind`, building it on first use"""
+        buf = cls._pool.get(kind)
+        if buf is None:
+            buf = cls._pool[kind] = cls._build(msgtype, payload_size)
+        return buf
+
+    @classmethod
+    def get_state_bytes(cls):
+        """Serialized form of `Packet.get_state`"""
+        return cls._pooled("get_state", 101)
+
+    @classmethod
+    def state_bytes(cls, hue: int, saturation: float, brightness: float,
+                    kelvin: int = 3500, duration: float = 0):
+        """Serialized form of `Packet.state` (pooled, see `_pool`)"""
+        buf = cls._pooled("state", 102, _STATE_PAYLOAD.size)
+        _STATE_PAYLOAD.pack_into(
+            buf, HEADER_LEN, 0, int(hue), int(saturation), int(brightness),
+            int(kelvin), int(duration * 1000))
+        return buf
+
+    @classmethod
+    def state_batch(cls, values: list) -> list:
+        """Serialized state packets for a list of
+        (hue, saturation, brightness, kelvin, duration) tuples
+
+        One header+payload template is built and cloned per tuple, so a
+        whole animation batch costs one buffer copy and one payload pack
+        per frame. The returned buffers are independent (not pooled).
+        """
+        base = cls._build(102, _STATE_PAYLOAD.size)
+        bufs = []
+        for hue, saturation, brightness, kelvin, duration in values:
+            buf = bytearray(base)
+            _STATE_PAYLOAD.pack_into(
+                buf, HEADER_LEN, 0, int(hue), int(saturation),
+                int(brightness), int(kelvin), int(duration * 1000))
+            bufs.append(buf)
+        return bufs
+
+    @classmethod
+    def power_bytes(cls, power: bool, duration: float = 0):
+        """Serialized form of `Packet.power` (pooled, see `_pool`)"""
+        buf = cls._pooled("power", 117, _POWER_PAYLOAD.size)
+        _POWER_PAYLOAD.pack_into(
+            buf, HEADER_LEN, int(0xFFFF * power), int(duration * 1000))
+        return buf
+
+    @classmethod
+    def fastpwr_bytes(cls, power: bool):
+        """Serialized form of `Packet.fastpwr` (pooled, see `_pool`)"""
+        buf = cls._pooled("fastpwr", 21, _U16.size)
+        _U16.pack_into(buf, HEADER_LEN, int(0xFFFF * power))
+        return buf
+
+    @classmethod
+    def get_state(cls):
+        """Generate packet for getting light state"""
+        # https://lan.developer.lifx.com/docs/querying-the-device-for-data#getcolor---packet-101
+        packet = cls()
+        packet.set_headers(101, res_required=True)
+        return packet
+
+    @classmethod
+    def state(cls, hue: int, saturation: float, brightness: float,
+              kelvin: int = 3500, duration: float = 0):
+        """Generate packet changing state to HSL(kelvin), fading over `duration` seconds
+        `hue`: 0-65535
+        `saturation`: 0-65535
+        `brightness`: 0-65535
+        `kelvin`: 2500-9000
+        `duration`: 0-4294967 seconds
+        """
+        # https://lan.developer.lifx.com/docs/changing-a-device#setcolor---packet-102
+        packet = cls(_STATE_PAYLOAD.size)
+        packet.set_headers(102)
+        _STATE_PAYLOAD.pack_into(
+            packet.buf, HEADER_LEN, 0, int(hue), int(saturation),
+            int(brightness), int(kelvin), int(duration * 1000))
+        return packet
+
+    @classmethod
+    def power(cls, power: bool, duration: float = 0):
+        """Generate packet with light `level` fading over `duration` seconds"""
+        # https://lan.developer.lifx.com/docs/changing-a-device#setlightpower---packet-117
+        packet = cls(_POWER_PAYLOAD.size)
+        packet.set_headers(117)
+        _POWER_PAYLOAD.pack_into(
+            packet.buf, HEADER_LEN, int(0xFFFF * power), int(duration * 1000))
+        return packet
+
+    @classmethod
+    def fastpwr(cls, power: bool):
+        """Generate packet for power, no fading"""
+        # https://lan.developer.lifx.com/docs/changing-a-device#setpower---packet-21
+        packet = cls(_U16.size)
+        packet.set_headers(21)
+        # 0xFFFF or 0x0000
+        _U16.pack_into(packet.buf, HEADER_LEN, int(0xFFFF * power))
+        return packet
+
+    @classmethod
+    def multi_zone(cls, hues, saturations, brightnesses, kelvins,
+                   zone_index: int = 0, duration: float = 0, apply: int = 1):
+        """Generate packet setting up to 82 color zones in one message
+
+        The color channels are parallel uint16 arrays (numpy arrays give
+        the jitted packer its fast path; plain sequences also work).
+        https://lan.developer.lifx.com/docs/changing-a-device#setextendedcolorzones---packet-510
+        """
+        count = len(hues)
+        if count > MAX_ZONES:
+            raise ValueError(f"At most {MAX_ZONES} zones per packet, got {count}")
+        packet = cls(_ZONES_PAYLOAD.size + MAX_ZONES * 8)
+        packet.set_headers(510)
+        _ZONES_PAYLOAD.pack_into(
+            packet.buf, HEADER_LEN, int(duration * 1000), apply,
+            zone_index, count)
+        pack_hsbk_array(packet.buf, HEADER_LEN + _ZONES_PAYLOAD.size,
+                        hues, saturations, brightnesses, kelvins)
+        return packet
+
+
 if __name__ == "__main__":
-    # An example output
-    powerpacket = Packet.power(True, 10)
+    # An example output, via the debuggable tree builder
+    powerpacket = LegacyPacket.power(True, 10)
 
     powerpacket.pprint()
     print(powerpacket)
@@ -1,42 +1,65 @@
 """Detects temperature of cpu and toggle light if drastic decrease"""
+import atexit
 import time
-import csv
+from collections import deque
+
+import numpy as np
+
 from toggle import toggle
 
-temps = []
+# Preallocated history, doubled when full; ntemps is the fill level
+temps = np.empty(1 << 16, dtype=np.float32)
+ntemps = 0
 TIMESTEP = 0.5
 THRESHOLD = 1.5
+WINDOW = 5
+
+# Opened once; reopening per poll costs an openat/close pair every tick
+THERM = open("/sys/class/thermal/thermal_zone0/temp", "rb", buffering=0)
+
+
+def read_temp():
+    """Read the cpu temperature in degrees C"""
+    THERM.seek(0)
+    return int(THERM.read()) / 1000
+
+
+def dump_csv():
+    """Write the collected samples to templog.csv"""
+    rows = np.column_stack([np.arange(ntemps) * TIMESTEP, temps[:ntemps]])
+    np.savetxt("templog.csv", rows, delimiter=";",
+               header="time;temp", comments="", fmt=("%.1f", "%.3f"))
+
 
+# Flush the log on any exit, crash included
+atexit.register(dump_csv)
 
-def average(items, decimals=None):
-    """Calculate average of list and round"""
-    if not items:
-        return 0
-    result = sum(items) / len(items)
-    return round(result, decimals) if decimals else result
 
+# Rolling window with an incrementally maintained sum, so the average
+# is O(1) instead of slicing and re-summing the history every tick
+window = deque(maxlen=WINDOW)
+wsum = 0.0
 
 while True:
     try:
-        with open("/sys/class/thermal/thermal_zone0/temp") as f:
-            temp = float(f.read())
-            tempC = temp / 1000
-            part = temps[-5:]  # Slice to calculate average on
-            avg = average(part, decimals=1)
-            if avg - tempC > THRESHOLD:
-                print()
-                print("Touching sensor!!!")
-                print(part, tempC)
-                toggle()
-            temps.append(tempC)
-            print(f"{tempC} average: {avg}", end="\r")
-            time.sleep(TIMESTEP)
-    except KeyboardInterrupt as err:
+        tempC = read_temp()
+        avg = round(wsum / len(window), 1) if window else 0
+        if avg - tempC > THRESHOLD:
+            print()
+            print("Touching sensor!!!")
+            print(list(window), tempC)
+            toggle()
+        if len(window) == WINDOW:
+            wsum -= window[0]
+        window.append(tempC)
+        wsum += tempC
+        if ntemps == temps.size:
+            temps = np.resize(temps, temps.size * 2)
+        temps[ntemps] = tempC
+        ntemps += 1
+        print(f"{tempC} average: {avg}", end="\r")
+        time.sleep(TIMESTEP)
+    except KeyboardInterrupt:
         print()
-        print(temps)
-        with open("templog.csv", "w", newline="") as csvfile:
-            writer = csv.writer(csvfile, delimiter=";")
-            writer.writerow(["time", "temp"])
-            for index, row in enumerate(temps):
-                writer.writerow([TIMESTEP * index, row])
-        raise err
+        print(temps[:ntemps])
+        raise
@@ -1,17 +1,33 @@
 """Test the lifx module"""
-from lifx import Device, get_state, send_packet
+import logging
+
+from lifx_core import Device, get_state, send_packet, send_packets
 from packet_builder import Packet
 
+log = logging.getLogger(__name__)
+
 
 def brightness(state, level, duration=0):
-    """Set lifx to select brightness level"""
+    """Set lifx to select brightness level
+
+    `level` may also be a sequence of levels, sent as one batch
+    (e.g. for animations).
+    """
+    if isinstance(level, (list, tuple)):
+        send_packets(
+            Device.Taklampa,
+            Packet.state_batch([
+                (state.hue, state.saturation, lvl * 0xFFFF,
+                 state.kelvin, duration)
+                for lvl in level]))
+        return
     send_packet(
         Device.Taklampa,
-        Packet.state(
-            state.get("hue", 0),
-            state.get("saturation", 0),
+        Packet.state_bytes(
+            state.hue,
+            state.saturation,
             level * 0xFFFF,
-            state.get("kelvin", 3500),
+            state.kelvin,
             duration
         ))
 
@@ -19,11 +35,11 @@ def brightness(state, level, duration=0):
 def toggle():
     """Toggle the lifx light"""
     state = get_state(Device.Taklampa)
-    if state["brightness"] > 0:
+    if state.brightness > 0:
         brightness(state, 0)
     else:
         brightness(state, 1)
-    print(state)
+    log.debug("state=%s", state)
 
 
 if __name__ == "__main__":